@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+from sacapi import sacapi
+from sacapi import mockserver
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows.  Peak RSS is then reported as None.
+    resource = None
+
+# Throughput benchmark for sacapi, run against the local mock server in sacapi.mockserver, so it needs no SAC tenant
+#   and no network access.  For each phase it reports wall clock time, rows/s, the number of requests per endpoint
+#   that reached the server and the peak RSS of the benchmark process.  By default the mock server runs in a
+#   separate process, so that its memory use does not show up in the peak RSS figures.
+#
+#   python -m sacapi.benchmark --rows 100000 --dimensions 8 --latency 0.005
+#
+# Peak RSS is a high-water mark for the whole process; a phase can only report the same or a higher value than
+#   the phases before it.
+
+
+class MockServerProcess(object):
+    def __init__(self, args):
+        serverArgs = [sys.executable, "-m", "sacapi.mockserver", "--port", "0", "--models", str(args.models), "--dimensions", str(args.dimensions),
+                      "--measures", str(args.measures), "--cardinality", str(args.cardinality), "--rows", str(args.rows),
+                      "--page-size", str(args.page_size), "--latency", str(args.latency), "--job-duration", str(args.job_duration),
+                      "--failing-models", str(args.failing_models)]
+        env = dict(os.environ)
+        packageRoot = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env["PYTHONPATH"] = os.pathsep.join([packageRoot] + [path for path in [env.get("PYTHONPATH")] if path])
+        self.process = subprocess.Popen(serverArgs, stdout=subprocess.PIPE, env=env, text=True)
+        startLine = self.process.stdout.readline()
+        if not startLine:
+            self.process.wait()
+            errorMsg = "Mock server process exited during startup with return code %s" % self.process.returncode
+            raise RuntimeError(errorMsg)
+        self.url = startLine.strip().rsplit(" ", 1)[-1]
+        self.urlAccessToken = self.url + "/oauth/token"
+
+    def stats(self):
+        with urllib.request.urlopen(self.url + "/mock/stats") as response:
+            return json.loads(response.read())
+
+    def resetStats(self):
+        request = urllib.request.Request(self.url + "/mock/reset", data=b"", method="POST")
+        with urllib.request.urlopen(request) as response:
+            response.read()
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+        self.process.stdout.close()
+
+
+class InProcessMockServer(object):
+    def __init__(self, args):
+        models = mockserver.createModels(args.models, args.dimensions, args.measures, args.cardinality, args.rows, args.failing_models)
+        self.server = mockserver.MockSACServer(models, latency=args.latency, pageSize=args.page_size, jobDuration=args.job_duration).start()
+        self.url = self.server.url
+        self.urlAccessToken = self.server.urlAccessToken
+
+    def stats(self):
+        return self.server.stats()
+
+    def resetStats(self):
+        self.server.resetStats()
+
+    def stop(self):
+        self.server.stop()
+
+
+def peakRSSMegabytes():
+    if resource is None:
+        return None
+    maxRSS = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # bytes on macOS, kilobytes everywhere else
+        return maxRSS / (1024.0 * 1024.0)
+    return maxRSS / 1024.0
+
+
+def runPhase(results, server, phaseName, rows, phaseFunction):
+    server.resetStats()
+    startTime = time.perf_counter()
+    phaseFunction()
+    elapsed = time.perf_counter() - startTime
+    stats = server.stats()
+    rowsPerSecond = None
+    if rows and (elapsed > 0):
+        rowsPerSecond = rows / elapsed
+    results.append({"phase": phaseName, "seconds": elapsed, "rows": rows, "rowsPerSecond": rowsPerSecond,
+                     "requests": stats["totalRequests"], "requestsByEndpoint": stats["requests"], "bytesReceived": stats["bytesSent"],
+                     "peakRSSMB": peakRSSMegabytes()})
+
+
+def runBenchmark(args):
+    # Plain http is only acceptable because the server is local
+    os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
+    if args.in_process:
+        server = InProcessMockServer(args)
+    else:
+        server = MockServerProcess(args)
+
+    results = []
+    state = {}
+    try:
+        sac = sacapi.SACConnection("mock", "local", urlTenant=server.url, urlAccessToken=server.urlAccessToken)
+        modelIDs = [model.modelID for model in mockserver.createModels(args.models, 0, 0, 1, 0)]
+        pageSize = args.client_page_size
+
+        def loadMetadata():
+            sac.connect("benchmarkClient", "benchmarkSecret")
+            state["metadata"] = [sac.getModelMetadata(modelID) for modelID in modelIDs]
+
+        def export():
+            state["factData"] = sac.getFactData(state["metadata"][0], pageSize)
+
+        def exportCached():
+            sac.getFactData(state["metadata"][0], pageSize)
+
+        uploadRows = min(args.upload_rows, args.rows)
+
+        # Both upload phases go through a LoadJobManager, so that both measure the whole job, up to COMPLETED.
+        #   upload() on its own returns as soon as the job has been started.
+        def upload():
+            with sac.createLoadJobManager(maxWorkers=1, pollInterval=0.05, maxPollInterval=1.0) as manager:
+                loadJob = manager.submit(state["metadata"][0], state["factData"][:uploadRows])
+            loadJob.result()
+
+        def concurrentUpload():
+            with sac.createLoadJobManager(maxWorkers=args.workers, pollInterval=0.05, maxPollInterval=1.0) as manager:
+                loadJobs = [manager.submit(modelMetadata, state["factData"][:uploadRows]) for modelMetadata in state["metadata"]]
+            # Jobs into --failing-models models are expected to fail; anything else is a real error
+            for loadJob in loadJobs:
+                if not isinstance(loadJob.error, sacapi.JobFailedError):
+                    loadJob.result()
+
+        runPhase(results, server, "metadata load", None, loadMetadata)
+        runPhase(results, server, "export", args.rows, export)
+        if args.cache:
+            sac.enableFactDataCache(maxBytes=1024 * 1024 * 1024, ttl=None)
+            sac.getFactData(state["metadata"][0], pageSize)
+            runPhase(results, server, "export (cached)", args.rows, exportCached)
+            sac.disableFactDataCache()
+        runPhase(results, server, "upload", uploadRows, upload)
+        runPhase(results, server, "concurrent upload (%s models)" % args.models, uploadRows * args.models, concurrentUpload)
+    finally:
+        server.stop()
+    return results
+
+
+def formatResults(results):
+    lines = ["%-34s %10s %10s %14s %9s %12s" % ("phase", "seconds", "rows", "rows/s", "requests", "peak RSS MB")]
+    for result in results:
+        rows = "-" if result["rows"] is None else str(result["rows"])
+        rowsPerSecond = "-" if result["rowsPerSecond"] is None else "%.0f" % result["rowsPerSecond"]
+        peakRSS = "-" if result["peakRSSMB"] is None else "%.1f" % result["peakRSSMB"]
+        lines.append("%-34s %10.3f %10s %14s %9s %12s" % (result["phase"], result["seconds"], rows, rowsPerSecond, result["requests"], peakRSS))
+    return "\n".join(lines)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog="python -m sacapi.benchmark", description="Offline throughput benchmark for sacapi, against a local mock SAC server")
+    mockserver.addModelArguments(parser)
+    parser.add_argument("--client-page-size", type=int, default=None, help="pagesize passed to getFactData()")
+    parser.add_argument("--upload-rows", type=int, default=10000, help="rows per model in the upload phases")
+    parser.add_argument("--workers", type=int, default=8, help="LoadJobManager workers in the concurrent upload phase")
+    parser.add_argument("--cache", action="store_true", help="also measure a getFactData() call served from the fact data cache")
+    parser.add_argument("--in-process", action="store_true", help="run the mock server in this process, instead of a subprocess")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+    if args.failing_models >= args.models:
+        # The single upload phase loads into the first model, which must not be one of the failing ones
+        parser.error("--failing-models must be less than --models")
+
+    results = runBenchmark(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(formatResults(results))
+
+
+if __name__ == "__main__":
+    main()
+
+
+# SPDX-FileCopyrightText: 2023 SAP SE or an SAP affiliate company <david.stocker@sap.com>
+#
+# SPDX-License-Identifier: Apache-2.0
@@ -0,0 +1,425 @@
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlencode, urlsplit
+
+# A local stand-in for the SAC endpoints that sacapi.SACConnection uses.  It serves synthetic models, so that sacapi
+#   can be exercised and benchmarked without a tenant.  It only implements as much of the export (OData) and import
+#   APIs as sacapi needs.  It does not evaluate $filter or $orderby on FactData; every query returns the full fact
+#   table.  AuditData supports $orderby on a single column and $top.
+#
+# Start it from the command line:
+#   python -m sacapi.mockserver --port 8080 --rows 100000
+# and connect to it with:
+#   os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
+#   sac = sacapi.SACConnection("mock", "local", urlTenant="http://127.0.0.1:8080", urlAccessToken="http://127.0.0.1:8080/oauth/token")
+#   sac.connect("clientID", "appSecret")
+#
+# GET /mock/stats returns the request counts per endpoint and POST /mock/reset sets them back to zero.
+
+
+class MockModel(object):
+    # A synthetic model with a Version dimension, a Date dimension, nDimensions generic dimensions, each with
+    #   cardinality members, and nMeasures measures.  Fact rows are generated from their row number, so the fact table
+    #   is never held in memory.  If failJobs is True, every load job into this model ends up FAILED after it is run.
+    def __init__(self, modelID, nDimensions = 4, nMeasures = 2, cardinality = 100, rows = 10000, failJobs = False):
+        self.modelID = modelID
+        self.failJobs = failJobs
+        self.description = "Mock model %s" % modelID
+        self.cardinality = cardinality
+        self.rows = rows
+        self.versions = {"public.Actual": "Actual"}
+        self.dates = ["%s%02d" % (year, month) for year in range(2020, 2025) for month in range(1, 13)]
+        self.dimensions = ["Dimension%s" % (nDim + 1) for nDim in range(nDimensions)]
+        self.measures = ["Measure%s" % (nMeasure + 1) for nMeasure in range(nMeasures)]
+        self.keyColumns = ["Version", "Date"] + self.dimensions
+        self.columns = self.keyColumns + self.measures
+        self.auditRecords = []
+
+    def memberID(self, dimension, nMember):
+        return "%s_%s" % (dimension, nMember)
+
+    def masterData(self, column):
+        if column == "Version":
+            return [{"ID": versionID, "Description": description, "VERSION": versionID} for versionID, description in self.versions.items()]
+        elif column == "Date":
+            return [{"DATE": dateID} for dateID in self.dates]
+        elif column in self.dimensions:
+            return [{"ID": self.memberID(column, nMember), "Description": "%s member %s" % (column, nMember)} for nMember in range(self.cardinality)]
+        elif column in self.measures:
+            return []
+        return None
+
+    def factRow(self, nRow):
+        row = {"Version": "public.Actual", "Date": self.dates[nRow % len(self.dates)]}
+        divisor = 1
+        for dimension in self.dimensions:
+            # Walk the dimensions like the digits of a number, so that rows differ from each other
+            row[dimension] = self.memberID(dimension, (nRow // divisor) % self.cardinality)
+            divisor = divisor * self.cardinality
+        for nMeasure, measure in enumerate(self.measures):
+            row[measure] = float((nRow * (nMeasure + 7)) % 100000) / 100
+        return row
+
+    def metadataXML(self):
+        keyRefs = "".join('<PropertyRef Name="%s"/>' % column for column in self.keyColumns)
+        properties = "".join('<Property Name="%s" Type="Edm.String" Nullable="false"/>' % column for column in self.keyColumns)
+        properties = properties + "".join('<Property Name="%s" Type="Edm.Double"/>' % measure for measure in self.measures)
+        masterTypes = "".join('<EntityType Name="%sMaster"><Key><PropertyRef Name="ID"/></Key><Property Name="ID" Type="Edm.String"/></EntityType>' % column for column in self.keyColumns)
+        xml = '<?xml version="1.0" encoding="utf-8"?>'
+        xml = xml + '<edmx:Edmx Version="4.0" xmlns:edmx="http://docs.oasis-open.org/odata/ns/edmx"><edmx:DataServices>'
+        xml = xml + '<Schema Namespace="%s" xmlns="http://docs.oasis-open.org/odata/ns/edm">' % self.modelID
+        xml = xml + '<EntityType Name="FactData"><Key>%s</Key>%s</EntityType>%s' % (keyRefs, properties, masterTypes)
+        xml = xml + '</Schema></edmx:DataServices></edmx:Edmx>'
+        return xml
+
+
+class MockSACServer(object):
+    def __init__(self, models, host = "127.0.0.1", port = 0, latency = 0.0, pageSize = 1000, jobDuration = 0.0):
+        self.models = {model.modelID: model for model in models}
+        self.latency = latency
+        self.pageSize = pageSize
+        self.jobDuration = jobDuration
+        self.accessToken = uuid.uuid4().hex
+        self.csrfToken = uuid.uuid4().hex
+        # Open, running and failed jobs are in jobs.  Completed jobs move to finishedJobs, so that anything left in jobs
+        #   after a load is either still running or was left behind on the tenant.
+        self.jobs = {}
+        self.finishedJobs = {}
+        # The next statusFailures job status reads are answered with 503, to simulate transient tenant errors
+        self.statusFailures = 0
+        self.requestCounts = {}
+        self.bytesSent = 0
+        self.lock = threading.Lock()
+
+        handlerClass = type("MockSACRequestHandler", (MockSACRequestHandler,), {"mockServer": self})
+        self.httpServer = ThreadingHTTPServer((host, port), handlerClass)
+        self.httpServer.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpServer.server_address[:2]
+        return "http://%s:%s" % (host, port)
+
+    @property
+    def urlAccessToken(self):
+        return self.url + "/oauth/token"
+
+    def start(self):
+        if self.thread is not None:
+            return self
+        self.thread = threading.Thread(target=self.httpServer.serve_forever, args=(0.05,), name="sacapi-mockserver", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpServer.shutdown()
+        self.httpServer.server_close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, excType, excValue, traceback):
+        self.stop()
+
+    def countRequest(self, endpoint, nBytes):
+        with self.lock:
+            self.requestCounts[endpoint] = self.requestCounts.get(endpoint, 0) + 1
+            self.bytesSent = self.bytesSent + nBytes
+
+    def stats(self):
+        with self.lock:
+            return {"requests": dict(self.requestCounts), "totalRequests": sum(self.requestCounts.values()), "bytesSent": self.bytesSent}
+
+    def resetStats(self):
+        with self.lock:
+            self.requestCounts = {}
+            self.bytesSent = 0
+
+
+class MockSACRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1, so that the client's session can keep its connection open between requests
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without TCP_NODELAY every response stalls on delayed ACKs
+    disable_nagle_algorithm = True
+    mockServer = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def dispatch(self, method):
+        server = self.mockServer
+        urlParts = urlsplit(self.path)
+        path = unquote(urlParts.path)
+        query = dict(parse_qsl(urlParts.query, keep_blank_values=True))
+        contentLength = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(contentLength) if contentLength > 0 else b""
+
+        if path == "/mock/stats":
+            return self.sendJSON(200, server.stats())
+        elif path == "/mock/reset":
+            server.resetStats()
+            return self.sendJSON(200, server.stats())
+
+        if server.latency > 0:
+            time.sleep(server.latency)
+
+        if path == "/oauth/token":
+            if method != "POST":
+                return self.sendError("token", 405, "Method not allowed")
+            return self.sendJSON(200, {"access_token": server.accessToken, "token_type": "bearer", "expires_in": 3600}, "token")
+
+        if self.headers.get("Authorization") != "Bearer %s" % server.accessToken:
+            return self.sendError("unauthorized", 401, "Missing or invalid access token")
+
+        exportPrefix = "/api/v1/dataexport/providers/sac/"
+        importModelsPrefix = "/api/v1/dataimport/models"
+        importJobsPrefix = "/api/v1/dataimport/jobs/"
+        if path.startswith("/api/v1/dataexport/administration/Namespaces(NamespaceID='sac')/Providers"):
+            return self.handleProviders()
+        elif path.startswith(exportPrefix):
+            return self.handleExport(path[len(exportPrefix):].strip("/").split("/"), query)
+        elif path.startswith(importModelsPrefix):
+            return self.handleImportModels(method, path[len(importModelsPrefix):].strip("/"))
+        elif path.startswith(importJobsPrefix):
+            return self.handleImportJobs(method, path[len(importJobsPrefix):].strip("/").split("/"), body)
+        return self.sendError("unknown", 404, "No such endpoint %s" % path)
+
+    def providerList(self, serviceRoot):
+        server = self.mockServer
+        providers = []
+        for model in server.models.values():
+            serviceURL = "%s%s/%s" % (server.url, serviceRoot, model.modelID)
+            providers.append({"NamespaceID": "sac", "ProviderID": model.modelID, "ProviderName": model.description, "Description": model.description, "ServiceURL": serviceURL})
+        return providers
+
+    def handleProviders(self):
+        return self.sendJSON(200, {"value": self.providerList("/api/v1/dataexport/providers/sac")}, "providers")
+
+    def handleExport(self, pathParts, query):
+        server = self.mockServer
+        if (len(pathParts) != 2) or (pathParts[0] not in server.models):
+            return self.sendError("export", 404, "No such provider")
+        model = server.models[pathParts[0]]
+        resource = pathParts[1]
+
+        if resource == "$metadata":
+            return self.sendBody(200, model.metadataXML().encode("UTF-8"), "application/xml", "metadata")
+        elif resource == "AuditData":
+            return self.handleAuditData(model, query)
+        elif resource == "FactData":
+            return self.handleFactData(model, query)
+        elif resource.endswith("Master"):
+            members = model.masterData(resource[:-len("Master")])
+            if members is not None:
+                return self.sendJSON(200, {"value": members}, "master")
+        return self.sendError("export", 404, "No such resource %s" % resource)
+
+    def handleAuditData(self, model, query):
+        server = self.mockServer
+        with server.lock:
+            auditRecords = list(model.auditRecords)
+        if "$orderby" in query:
+            orderByCol, _, orderDir = query["$orderby"].partition(" ")
+            auditRecords.sort(key=lambda auditRecord: auditRecord.get(orderByCol), reverse=(orderDir.strip() == "desc"))
+        if "$top" in query:
+            auditRecords = auditRecords[:int(query["$top"])]
+        pageSize = int(query.get("pagesize", server.pageSize))
+        skip = int(query.get("$skiptoken", 0))
+        pageEnd = min(skip + pageSize, len(auditRecords))
+
+        responseJson = {"value": auditRecords[skip:pageEnd]}
+        if pageEnd < len(auditRecords):
+            nextQuery = dict(query)
+            nextQuery["$skiptoken"] = pageEnd
+            responseJson["@odata.nextLink"] = "%s/api/v1/dataexport/providers/sac/%s/AuditData?%s" % (server.url, model.modelID, urlencode(nextQuery))
+        return self.sendJSON(200, responseJson, "auditData")
+
+    def handleFactData(self, model, query):
+        server = self.mockServer
+        pageSize = int(query.get("pagesize", server.pageSize))
+        skip = int(query.get("$skiptoken", 0))
+        lastRow = model.rows
+        if "$top" in query:
+            lastRow = min(lastRow, int(query["$top"]))
+        pageEnd = min(skip + pageSize, lastRow)
+
+        responseJson = {"value": [model.factRow(nRow) for nRow in range(skip, pageEnd)]}
+        if pageEnd < lastRow:
+            nextQuery = dict(query)
+            nextQuery["$skiptoken"] = pageEnd
+            responseJson["@odata.nextLink"] = "%s/api/v1/dataexport/providers/sac/%s/FactData?%s" % (server.url, model.modelID, urlencode(nextQuery))
+        return self.sendJSON(200, responseJson, "factData")
+
+    def handleImportModels(self, method, subPath):
+        server = self.mockServer
+        if subPath == "":
+            extraHeaders = {}
+            if self.headers.get("x-csrf-token", "").lower() == "fetch":
+                extraHeaders["x-csrf-token"] = server.csrfToken
+            return self.sendJSON(200, {"models": self.providerList("/api/v1/dataimport/models")}, "importModels", extraHeaders)
+
+        pathParts = subPath.split("/")
+        if (len(pathParts) != 2) or (pathParts[0] not in server.models) or (pathParts[1] not in ("factData", "masterFactData")):
+            return self.sendError("jobCreate", 404, "No such import endpoint %s" % subPath)
+        if method != "POST":
+            return self.sendError("jobCreate", 405, "Method not allowed")
+        if not self.checkCSRF():
+            return self.sendError("jobCreate", 403, "CSRF token validation failed")
+
+        jobID = uuid.uuid4().hex
+        with server.lock:
+            server.jobs[jobID] = {"modelID": pathParts[0], "status": "READY_FOR_DATA", "rows": 0, "failedRows": [], "runAt": None}
+        return self.sendJSON(200, {"jobID": jobID, "jobURL": "%s/api/v1/dataimport/jobs/%s" % (server.url, jobID)}, "jobCreate")
+
+    def handleImportJobs(self, method, pathParts, body):
+        server = self.mockServer
+        jobID = pathParts[0]
+        action = pathParts[1] if len(pathParts) > 1 else ""
+        endpoint = {"": "jobPush", "validate": "jobValidate", "invalidRows": "jobInvalidRows", "run": "jobRun", "status": "jobStatus"}.get(action, "jobUnknown")
+        if method == "DELETE":
+            endpoint = "jobDelete"
+        if (method != "GET") and not self.checkCSRF():
+            return self.sendError(endpoint, 403, "CSRF token validation failed")
+
+        with server.lock:
+            job = server.jobs.get(jobID, server.finishedJobs.get(jobID))
+        if job is None:
+            return self.sendError(endpoint, 404, "No such job %s" % jobID)
+
+        if method == "DELETE":
+            with server.lock:
+                server.jobs.pop(jobID, None)
+                server.finishedJobs.pop(jobID, None)
+            return self.sendBody(204, b"", "application/json", endpoint)
+        elif (endpoint == "jobPush") and (method == "POST"):
+            try:
+                tupleList = json.loads(body)["Data"]
+            except (ValueError, KeyError, TypeError):
+                return self.sendError(endpoint, 400, "Request body must be a JSON object with a Data list")
+            model = server.models[job["modelID"]]
+            failedRows = []
+            for tupleRow in tupleList:
+                missing = [column for column in model.columns if (column != "Version") and (column not in tupleRow)]
+                if missing:
+                    failedRows.append({"row": tupleRow, "reason": "Missing columns %s" % missing})
+            with server.lock:
+                job["rows"] = job["rows"] + len(tupleList)
+                job["failedRows"].extend(failedRows)
+                job["status"] = "READY_FOR_VALIDATION"
+            responseJson = {"jobID": jobID, "upsertedNumberRows": len(tupleList) - len(failedRows), "failedNumberRows": len(failedRows), "failedRows": failedRows}
+            return self.sendJSON(200, responseJson, endpoint)
+        elif (endpoint == "jobValidate") and (method == "POST"):
+            with server.lock:
+                job["status"] = "READY_FOR_WRITE"
+            responseJson = {"jobID": jobID, "failedNumberRows": len(job["failedRows"]), "invalidRowsURL": "%s/api/v1/dataimport/jobs/%s/invalidRows" % (server.url, jobID)}
+            return self.sendJSON(200, responseJson, endpoint)
+        elif (endpoint == "jobInvalidRows") and (method == "GET"):
+            return self.sendJSON(200, {"jobID": jobID, "failedRows": job["failedRows"]}, endpoint)
+        elif (endpoint == "jobRun") and (method == "POST"):
+            with server.lock:
+                job["status"] = "PROCESSING"
+                job["runAt"] = time.monotonic()
+            return self.sendJSON(200, {"jobID": jobID, "jobStatus": "PROCESSING"}, endpoint)
+        elif (endpoint == "jobStatus") and (method == "GET"):
+            with server.lock:
+                failThisRead = server.statusFailures > 0
+                if failThisRead:
+                    server.statusFailures = server.statusFailures - 1
+            if failThisRead:
+                return self.sendError(endpoint, 503, "Service temporarily unavailable")
+            with server.lock:
+                if (job["status"] == "PROCESSING") and (time.monotonic() - job["runAt"] >= server.jobDuration):
+                    model = server.models[job["modelID"]]
+                    if model.failJobs:
+                        job["status"] = "FAILED"
+                    else:
+                        job["status"] = "COMPLETED"
+                        model.auditRecords.append({"jobID": jobID, "rows": job["rows"], "Timestamp": "%.6f" % time.time()})
+                        server.finishedJobs[jobID] = server.jobs.pop(jobID)
+                jobStatus = job["status"]
+            return self.sendJSON(200, {"jobID": jobID, "jobStatus": jobStatus}, endpoint)
+        return self.sendError(endpoint, 404, "No such job endpoint %s" % "/".join(pathParts))
+
+    def checkCSRF(self):
+        return self.headers.get("x-csrf-token") == self.mockServer.csrfToken
+
+    def sendJSON(self, status, responseJson, endpoint = None, extraHeaders = None):
+        return self.sendBody(status, json.dumps(responseJson).encode("UTF-8"), "application/json", endpoint, extraHeaders)
+
+    def sendError(self, endpoint, status, errorMsg):
+        return self.sendJSON(status, {"error": {"code": status, "message": errorMsg}}, endpoint)
+
+    def sendBody(self, status, body, contentType, endpoint = None, extraHeaders = None):
+        # Count before responding, so that the counts are complete once the client has its response
+        if endpoint is not None:
+            self.mockServer.countRequest(endpoint, len(body))
+        self.send_response(status)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        if extraHeaders is not None:
+            for headerName, headerValue in extraHeaders.items():
+                self.send_header(headerName, headerValue)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+
+def createModels(nModels = 1, nDimensions = 4, nMeasures = 2, cardinality = 100, rows = 10000, failingModels = 0):
+    # The last failingModels models reject every load job
+    return [MockModel("MOCKMODEL%04d" % (nModel + 1), nDimensions, nMeasures, cardinality, rows, nModel >= nModels - failingModels) for nModel in range(nModels)]
+
+
+def addModelArguments(parser):
+    parser.add_argument("--models", type=int, default=1, help="number of synthetic models")
+    parser.add_argument("--dimensions", type=int, default=4, help="generic dimensions per model, in addition to Version and Date")
+    parser.add_argument("--measures", type=int, default=2, help="measures per model")
+    parser.add_argument("--cardinality", type=int, default=100, help="members per generic dimension")
+    parser.add_argument("--rows", type=int, default=10000, help="fact rows per model")
+    parser.add_argument("--page-size", type=int, default=1000, help="FactData page size, when the client does not set pagesize")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds of latency injected into every request")
+    parser.add_argument("--job-duration", type=float, default=0.0, help="seconds a load job stays PROCESSING after it is run")
+    parser.add_argument("--failing-models", type=int, default=0, help="number of models (the last ones) whose load jobs end FAILED")
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog="python -m sacapi.mockserver", description="Local stand-in for the SAC endpoints used by sacapi")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080, help="0 picks a free port")
+    addModelArguments(parser)
+    args = parser.parse_args(argv)
+
+    models = createModels(args.models, args.dimensions, args.measures, args.cardinality, args.rows, args.failing_models)
+    server = MockSACServer(models, args.host, args.port, args.latency, args.page_size, args.job_duration)
+    print("sacapi mock server listening on %s" % server.url, flush=True)
+    try:
+        server.httpServer.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpServer.server_close()
+
+
+if __name__ == "__main__":
+    main()
+
+
+# SPDX-FileCopyrightText: 2023 SAP SE or an SAP affiliate company <david.stocker@sap.com>
+#
+# SPDX-License-Identifier: Apache-2.0
@@ -1,10 +1,21 @@
 import json
+import hashlib
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent import futures
 from oauthlib.oauth2 import BackendApplicationClient
 from requests_oauthlib import OAuth2Session
 from xml.dom import minidom
 
 class RESTError(ValueError):
-    pass
+    def __init__(self, message, statusCode = None):
+        ValueError.__init__(self, message)
+        self.statusCode = statusCode
 
 class OAuthError(ValueError):
     pass
@@ -24,6 +35,15 @@ class InvalidRowsError(ValueError):
 class JobDeleteFailure(ValueError):
     pass
 
+class CacheConfigError(ValueError):
+    pass
+
+class JobFailedError(ValueError):
+    pass
+
+class JobTimeoutError(ValueError):
+    pass
+
 
 class FilterOperators(object):
     EQUAL = "eq"
@@ -48,6 +68,19 @@ class UpdatePolicy(object):
     UPDATE = "Update"
     CLEAN_AND_REPLACE = "CleanAndReplace"
 
+class JobStatus(object):
+    SUBMITTED = "SUBMITTED"
+    STAGING = "STAGING"
+    READY_FOR_DATA = "READY_FOR_DATA"
+    READY_FOR_VALIDATION = "READY_FOR_VALIDATION"
+    READY_FOR_WRITE = "READY_FOR_WRITE"
+    PROCESSING = "PROCESSING"
+    COMPLETED = "COMPLETED"
+    FAILED = "FAILED"
+    CANCELLED = "CANCELLED"
+    # The job was run, but the LoadJobManager stopped polling it (timeout or shutdown) before it finished
+    POLLING_STOPPED = "POLLING_STOPPED"
+
 
 
 logicGate = FilterLogicGateSymbols()
@@ -72,6 +105,16 @@ class ModelMetadata(object):
 
     def __init__(self, providerID):
         self.modelID = providerID
+        # Hash of the $metadata document, set by getModelMetadata().  Results are only cached when it is known.
+        self.metadataVersion = None
+
+        # Per-instance containers.  The class level defaults above would otherwise be shared by every model.
+        self.dimensions = {}
+        self.dateDimensions = {}
+        self.measures = []
+        self.accounts = {}
+        self.versions = {}
+        self.mapping = {}
 
     def initializeMapping(self):
         firstKey = list(self.versions.keys())[0]
@@ -146,25 +189,566 @@ class ModelMetadata(object):
 
 
 
+class FactDataCache(object):
+    # Opt-in result cache for getFactData().  Entries are keyed by the model metadata version and the fully resolved
+    #   FactData URL, so any change to the filters, the page size or the model structure produces a new key.
+    # There are two tiers.  The in-memory tier is an LRU, bounded by the (approximate) serialized size of the cached
+    #   records.  The optional on-disk tier stores one JSON file per entry in cacheDir and is also size bounded.  Disk
+    #   file names start with a hash of the providerID, so that a model's entries can be found without reading them.
+    # Entries older than ttl seconds are treated as misses and dropped.  A ttl of None means that entries never expire
+    #   on their own and are only removed by eviction or invalidation.
+    # Every entry remembers the model's audit fingerprint at the time it was stored.  Once an audit fingerprint is known
+    #   for a model (see checkAuditData()), entries stored with a different, or no, fingerprint are misses.
+    # Models with load jobs that have been run, but not yet seen to finish, are pending.  Their results are not cached.
+    def __init__(self, maxBytes = 64 * 1024 * 1024, ttl = 900, cacheDir = None, maxDiskBytes = 512 * 1024 * 1024):
+        if not self.isPositiveNumber(maxBytes):
+            errorMsg = "Invalid value '%s' passed as maxBytes.  The in-memory cache size must be a positive number of bytes" % maxBytes
+            raise CacheConfigError(errorMsg)
+        if (ttl is not None) and (not self.isPositiveNumber(ttl)):
+            errorMsg = "Invalid value '%s' passed as ttl.  ttl must be a positive number of seconds, or None" % ttl
+            raise CacheConfigError(errorMsg)
+        if (cacheDir is not None) and (not self.isPositiveNumber(maxDiskBytes)):
+            errorMsg = "Invalid value '%s' passed as maxDiskBytes.  The on-disk cache size must be a positive number of bytes" % maxDiskBytes
+            raise CacheConfigError(errorMsg)
+
+        self.maxBytes = maxBytes
+        self.ttl = ttl
+        self.cacheDir = cacheDir
+        self.maxDiskBytes = maxDiskBytes
+        self.currentBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.auditFingerprints = {}
+        self.auditCheckTimes = {}
+        self.pendingJobs = {}
+        self.lock = threading.RLock()
+
+        if self.cacheDir is not None:
+            os.makedirs(self.cacheDir, exist_ok=True)
+
+    def makeKey(self, modelMetadata, urlFactData):
+        # Returns None if the model's metadata version is unknown, e.g. for a ModelMetadata that was not read with
+        #   getModelMetadata().  Such results are not cached.
+        if modelMetadata.metadataVersion is None:
+            return None
+        return "%s|%s" % (modelMetadata.metadataVersion, urlFactData)
+
+    def get(self, key, providerID):
+        with self.lock:
+            now = time.time()
+            if key in self.entries:
+                providerID, created, auditFingerprint, size, records = self.entries[key]
+                if self.isStale(providerID, created, auditFingerprint, now):
+                    self.removeEntry(key)
+                else:
+                    self.entries.move_to_end(key)
+                    self.hits = self.hits + 1
+                    return self.copyRecords(records)
+
+            diskEntry = self.readDiskEntry(key, providerID, now)
+            if diskEntry is not None:
+                created, auditFingerprint, records = diskEntry
+                self.putMemoryEntry(key, providerID, created, auditFingerprint, records)
+                self.hits = self.hits + 1
+                return self.copyRecords(records)
+
+            self.misses = self.misses + 1
+            return None
+
+    def put(self, key, providerID, records):
+        with self.lock:
+            if self.isPending(providerID):
+                return
+            created = time.time()
+            auditFingerprint = self.auditFingerprints.get(providerID)
+            self.putMemoryEntry(key, providerID, created, auditFingerprint, self.copyRecords(records))
+            self.writeDiskEntry(key, providerID, created, auditFingerprint, records)
+
+    def invalidate(self, providerID = None):
+        # Drop every entry for providerID, or the whole cache if no providerID is given.  The model's audit fingerprint
+        #   is dropped as well, as it no longer describes the model's data.
+        with self.lock:
+            for key in list(self.entries.keys()):
+                if (providerID is None) or (self.entries[key][0] == providerID):
+                    self.removeEntry(key)
+            filePrefix = ""
+            if providerID is not None:
+                filePrefix = self.providerHash(providerID) + "_"
+            for diskPath in self.listDiskEntries():
+                if os.path.basename(diskPath).startswith(filePrefix):
+                    self.removeDiskFile(diskPath)
+            if providerID is None:
+                self.auditFingerprints = {}
+                self.auditCheckTimes = {}
+            else:
+                self.auditFingerprints.pop(providerID, None)
+                self.auditCheckTimes.pop(providerID, None)
+
+    def checkAuditData(self, providerID, auditRecords):
+        # Record the fingerprint of the model's audit trail.  If it differs from the one seen last time, the model data
+        #   has changed and any cached result for that model is stale.  Returns True if an invalidation happened.
+        fingerprint = hashlib.sha256(json.dumps(auditRecords, sort_keys=True, default=str).encode("UTF-8")).hexdigest()
+        with self.lock:
+            previous = self.auditFingerprints.get(providerID)
+            changed = (previous is not None) and (previous != fingerprint)
+            if changed:
+                self.invalidate(providerID)
+            self.auditFingerprints[providerID] = fingerprint
+            self.auditCheckTimes[providerID] = time.monotonic()
+            return changed
+
+    def auditCheckDue(self, providerID, interval):
+        # True if the model's audit data has not been checked within the last interval seconds.  Invalidating a model
+        #   makes its next check due straight away.
+        with self.lock:
+            lastCheck = self.auditCheckTimes.get(providerID)
+            return (lastCheck is None) or ((time.monotonic() - lastCheck) >= interval)
+
+    def addPendingJob(self, providerID, jobID):
+        with self.lock:
+            self.pendingJobs.setdefault(providerID, set()).add(jobID)
+
+    def finishPendingJob(self, providerID, jobID):
+        # The job has finished (or never ran), so the model's data may have changed
+        with self.lock:
+            if providerID in self.pendingJobs:
+                self.pendingJobs[providerID].discard(jobID)
+                if not self.pendingJobs[providerID]:
+                    del self.pendingJobs[providerID]
+            self.invalidate(providerID)
+
+    def pendingJobIDs(self, providerID):
+        with self.lock:
+            return list(self.pendingJobs.get(providerID, ()))
+
+    def isPending(self, providerID):
+        with self.lock:
+            return providerID in self.pendingJobs
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.currentBytes, "maxBytes": self.maxBytes, "hits": self.hits, "misses": self.misses}
+
+    def isStale(self, providerID, created, auditFingerprint, now):
+        if (self.ttl is not None) and ((now - created) > self.ttl):
+            return True
+        currentFingerprint = self.auditFingerprints.get(providerID)
+        return (currentFingerprint is not None) and (currentFingerprint != auditFingerprint)
+
+    def isPositiveNumber(self, value):
+        return isinstance(value, (int, float)) and (not isinstance(value, bool)) and (value > 0)
+
+    def copyRecords(self, records):
+        # Fact data records are flat dicts, so a shallow copy of each record is enough to keep callers from
+        #   modifying the cached result
+        return [dict(record) for record in records]
+
+    def estimateSize(self, records):
+        return len(json.dumps(records, default=str))
+
+    def putMemoryEntry(self, key, providerID, created, auditFingerprint, records):
+        size = self.estimateSize(records)
+        if key in self.entries:
+            self.removeEntry(key)
+        if size > self.maxBytes:
+            # Too large to ever fit.  It can still live in the disk tier
+            return
+        self.entries[key] = (providerID, created, auditFingerprint, size, records)
+        self.currentBytes = self.currentBytes + size
+        while self.currentBytes > self.maxBytes:
+            lruKey = next(iter(self.entries))
+            self.removeEntry(lruKey)
+
+    def removeEntry(self, key):
+        providerID, created, auditFingerprint, size, records = self.entries.pop(key)
+        self.currentBytes = self.currentBytes - size
+
+    def providerHash(self, providerID):
+        return hashlib.sha256(providerID.encode("UTF-8")).hexdigest()[:16]
+
+    def diskPathForKey(self, key, providerID):
+        fileName = "%s_%s.json" % (self.providerHash(providerID), hashlib.sha256(key.encode("UTF-8")).hexdigest())
+        return os.path.join(self.cacheDir, fileName)
+
+    def listDiskEntries(self):
+        if self.cacheDir is None:
+            return []
+        return [os.path.join(self.cacheDir, fileName) for fileName in os.listdir(self.cacheDir) if fileName.endswith(".json")]
+
+    def removeDiskFile(self, diskPath):
+        try:
+            os.remove(diskPath)
+        except OSError:
+            pass
+
+    def readDiskEntry(self, key, providerID, now):
+        if self.cacheDir is None:
+            return None
+        diskPath = self.diskPathForKey(key, providerID)
+        try:
+            with open(diskPath, "r", encoding="utf-8") as diskFile:
+                diskJson = json.load(diskFile)
+        except OSError:
+            return None
+        except ValueError:
+            # Truncated or otherwise corrupt file; treat it as a miss
+            self.removeDiskFile(diskPath)
+            return None
+
+        if (diskJson.get("key") != key) or self.isStale(providerID, diskJson["created"], diskJson.get("auditFingerprint"), now):
+            self.removeDiskFile(diskPath)
+            return None
+        os.utime(diskPath)
+        return (diskJson["created"], diskJson.get("auditFingerprint"), diskJson["records"])
+
+    def writeDiskEntry(self, key, providerID, created, auditFingerprint, records):
+        if self.cacheDir is None:
+            return
+        diskPath = self.diskPathForKey(key, providerID)
+        tempPath = "%s.%s.tmp" % (diskPath, threading.get_ident())
+        diskJson = {"key": key, "providerID": providerID, "created": created, "auditFingerprint": auditFingerprint, "records": records}
+        try:
+            with open(tempPath, "w", encoding="utf-8") as diskFile:
+                json.dump(diskJson, diskFile, default=str)
+            os.replace(tempPath, diskPath)
+        except OSError as e:
+            self.removeDiskFile(tempPath)
+            warningMsg = "WARNING.  Failed to write fact data cache file %s.  %s" % (diskPath, e)
+            print(warningMsg)
+            return
+
+        # Evict the least recently used files until the disk tier fits within maxDiskBytes
+        diskFiles = []
+        diskBytes = 0
+        for currPath in self.listDiskEntries():
+            try:
+                fileStat = os.stat(currPath)
+            except OSError:
+                continue
+            diskFiles.append((fileStat.st_mtime, fileStat.st_size, currPath))
+            diskBytes = diskBytes + fileStat.st_size
+        diskFiles.sort()
+        for mtime, fileSize, currPath in diskFiles:
+            if diskBytes <= self.maxDiskBytes:
+                break
+            self.removeDiskFile(currPath)
+            diskBytes = diskBytes - fileSize
+
+
+
+class LoadJob(object):
+    # Handle for a load job that was submitted to a LoadJobManager.  jobID is None until the job has been opened
+    #   on the tenant.  status follows the JobStatus values; statusResponse holds the last status read from SAC.
+    #   tupleList is released once the data has been staged, so that finished jobs don't keep their payload alive.
+    def __init__(self, modelMetadata, tupleList, factOnly, forceCommit, importMethod):
+        self.modelMetadata = modelMetadata
+        self.modelID = modelMetadata.modelID
+        self.tupleList = tupleList
+        self.factOnly = factOnly
+        self.forceCommit = forceCommit
+        self.importMethod = importMethod
+        self.jobID = None
+        self.status = JobStatus.SUBMITTED
+        self.statusResponse = None
+        self.error = None
+        self.future = futures.Future()
+
+        # Polling state, maintained by the LoadJobManager's poller
+        self.pollInterval = None
+        self.pollDeadline = None
+        self.pollFailures = 0
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout = None):
+        return self.future.result(timeout)
+
+    def cancel(self):
+        # Only jobs that have not yet started can be cancelled
+        cancelled = self.future.cancel()
+        if cancelled:
+            self.status = JobStatus.CANCELLED
+        return cancelled
+
+    def addCallback(self, callback):
+        # callback is called with this LoadJob as its only argument, once the job has finished
+        self.future.add_done_callback(lambda future: callback(self))
+
+
+class LoadJobManager(object):
+    # Runs many load jobs concurrently, across one or more models.  Worker threads open, stage, validate and run each
+    #   submitted job; maxWorkers limits how many jobs are in those steps at the same time.  Once a job has been run,
+    #   it is handed to a single poller thread, which polls every running job, with exponential backoff, until SAC
+    #   reports it as completed or failed.  So the number of jobs in flight on the tenant is not limited by maxWorkers.
+    # Transient status read errors (network errors, 429 and 5xx) are retried up to maxPollRetries times in a row.
+    # Jobs that fail after they have been opened on the tenant are deleted, so that no orphaned jobs remain.  Jobs
+    #   that are still running when polling stops (timeout, shutdown, or status read errors) are left alone and end up
+    #   as POLLING_STOPPED.
+    def __init__(self, sacConnection, maxWorkers = 8, pollInterval = 1.0, maxPollInterval = 30.0, backoffFactor = 2.0, timeout = 3600, maxPollRetries = 3):
+        if maxWorkers < 1:
+            errorMsg = "Invalid value '%s' passed as maxWorkers.  At least one worker is needed" % maxWorkers
+            raise RESTParamsError(errorMsg)
+        if (pollInterval <= 0) or (maxPollInterval < pollInterval) or (backoffFactor < 1):
+            errorMsg = "Invalid polling parameters.  pollInterval (%s) must be positive, maxPollInterval (%s) must not be smaller than pollInterval and backoffFactor (%s) must be at least 1" % (pollInterval, maxPollInterval, backoffFactor)
+            raise RESTParamsError(errorMsg)
+        if maxPollRetries < 0:
+            errorMsg = "Invalid value '%s' passed as maxPollRetries.  It must not be negative" % maxPollRetries
+            raise RESTParamsError(errorMsg)
+        self.sacConnection = sacConnection
+        self.pollInterval = pollInterval
+        self.maxPollInterval = maxPollInterval
+        self.backoffFactor = backoffFactor
+        self.timeout = timeout
+        self.maxPollRetries = maxPollRetries
+        self.jobs = []
+        self.shutdownEvent = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix="sacapi-load")
+
+        # Running jobs, as a heap of (nextPollTime, sequence, LoadJob).  The poller thread only exists while there are jobs to poll.
+        self.pollCondition = threading.Condition()
+        self.pollQueue = []
+        self.pollSequence = itertools.count()
+        self.pollerThread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.shutdown(wait=True, cancelPending=excType is not None)
+
+    def submit(self, modelMetadata, tupleList, factOnly = True, forceCommit = False, importMethod = "Update", callback = None):
+        # Returns a LoadJob immediately.  The job's future resolves to the final status response from SAC, or raises
+        #   the error that stopped the job (UnmatchedColumnsError, InvalidRowsError, JobFailedError, JobTimeoutError, ...)
+        loadJob = LoadJob(modelMetadata, tupleList, factOnly, forceCommit, importMethod)
+        if callback is not None:
+            loadJob.addCallback(callback)
+        self.jobs.append(loadJob)
+        self.executor.submit(self.runLoadJob, loadJob)
+        return loadJob
+
+    def wait(self, jobs = None, timeout = None):
+        # Blocks until all of the given jobs (default: every job submitted to this manager) have finished.
+        #   Returns a (done, notDone) tuple of LoadJob lists.
+        if jobs is None:
+            jobs = list(self.jobs)
+        jobLookup = {loadJob.future: loadJob for loadJob in jobs}
+        doneFutures, notDoneFutures = futures.wait(list(jobLookup.keys()), timeout=timeout)
+        doneJobs = [loadJob for loadJob in jobs if loadJob.future in doneFutures]
+        notDoneJobs = [loadJob for loadJob in jobs if loadJob.future in notDoneFutures]
+        return doneJobs, notDoneJobs
+
+    def asCompleted(self, jobs = None, timeout = None):
+        # Yields the LoadJobs as they finish
+        if jobs is None:
+            jobs = list(self.jobs)
+        jobLookup = {loadJob.future: loadJob for loadJob in jobs}
+        for future in futures.as_completed(list(jobLookup.keys()), timeout=timeout):
+            yield jobLookup[future]
+
+    def forgetFinishedJobs(self):
+        # Stop tracking the jobs that have finished and return them.  Use this in long running processes, so that
+        #   the default job list of wait() and asCompleted() does not keep growing.
+        finishedJobs = [loadJob for loadJob in self.jobs if loadJob.done()]
+        self.jobs = [loadJob for loadJob in self.jobs if not loadJob.done()]
+        return finishedJobs
+
+    def shutdown(self, wait = True, cancelPending = False):
+        if cancelPending:
+            # Stop polling and cancel the jobs that have not started yet.  Jobs that are already running on the
+            #   tenant are not deleted.
+            self.shutdownEvent.set()
+            for loadJob in self.jobs:
+                loadJob.cancel()
+            with self.pollCondition:
+                self.pollCondition.notify_all()
+        self.executor.shutdown(wait=wait)
+        if wait:
+            # No worker can hand over a job any more, so once the poller thread is gone, every job has finished
+            while True:
+                with self.pollCondition:
+                    pollerThread = self.pollerThread
+                if pollerThread is None:
+                    break
+                pollerThread.join()
+
+    def runLoadJob(self, loadJob):
+        if not loadJob.future.set_running_or_notify_cancel():
+            # Cancelled before it started
+            return
+
+        sac = self.sacConnection
+        try:
+            loadJob.status = JobStatus.STAGING
+            loadJob.jobID = sac.stageLoadJob(loadJob.modelMetadata, loadJob.tupleList, loadJob.factOnly, loadJob.forceCommit, loadJob.importMethod)
+        except Exception as e:
+            # stageLoadJob has already removed the job from the tenant, if it got as far as opening it
+            loadJob.status = JobStatus.FAILED
+            loadJob.error = e
+            loadJob.future.set_exception(e)
+            return
+        finally:
+            loadJob.tupleList = None
+
+        factDataCache = sac.factDataCache
+        if factDataCache is not None:
+            factDataCache.addPendingJob(loadJob.modelID, loadJob.jobID)
+        try:
+            loadJob.statusResponse = sac.runJob(loadJob.jobID)
+        except Exception as e:
+            # The job never ran, so it would be left behind on the tenant
+            self.failLoadJob(loadJob, e)
+            return
+
+        loadJob.status = JobStatus.PROCESSING
+        self.startPolling(loadJob)
+
+    def failLoadJob(self, loadJob, error):
+        loadJob.status = JobStatus.FAILED
+        loadJob.error = error
+        try:
+            self.sacConnection.deleteJob(loadJob.jobID)
+        except Exception:
+            pass
+        factDataCache = self.sacConnection.factDataCache
+        if factDataCache is not None:
+            factDataCache.finishPendingJob(loadJob.modelID, loadJob.jobID)
+        loadJob.future.set_exception(error)
+
+    def stopPolling(self, loadJob, error):
+        # The job may still be running, or even complete, on the tenant, so it is not an orphan and is not deleted.
+        #   It stays pending in the fact data cache.
+        loadJob.status = JobStatus.POLLING_STOPPED
+        loadJob.error = error
+        loadJob.future.set_exception(error)
+
+    def completeLoadJob(self, loadJob, statusResponse):
+        loadJob.status = JobStatus.COMPLETED
+        factDataCache = self.sacConnection.factDataCache
+        if factDataCache is not None:
+            factDataCache.finishPendingJob(loadJob.modelID, loadJob.jobID)
+        loadJob.future.set_result(statusResponse)
+
+    def lastJobStatus(self, loadJob):
+        if loadJob.statusResponse is None:
+            return None
+        return loadJob.statusResponse.get("jobStatus")
+
+    def startPolling(self, loadJob):
+        now = time.monotonic()
+        loadJob.pollInterval = self.pollInterval
+        if self.timeout is not None:
+            loadJob.pollDeadline = now + self.timeout
+        with self.pollCondition:
+            heapq.heappush(self.pollQueue, (now, next(self.pollSequence), loadJob))
+            if self.pollerThread is None:
+                self.pollerThread = threading.Thread(target=self.pollLoop, name="sacapi-load-poller", daemon=True)
+                self.pollerThread.start()
+            self.pollCondition.notify_all()
+
+    def schedulePoll(self, loadJob, waitTime):
+        with self.pollCondition:
+            heapq.heappush(self.pollQueue, (time.monotonic() + waitTime, next(self.pollSequence), loadJob))
+
+    def pollLoop(self):
+        while True:
+            stoppedJobs = []
+            loadJob = None
+            with self.pollCondition:
+                while loadJob is None:
+                    if self.shutdownEvent.is_set():
+                        stoppedJobs = [queued[2] for queued in self.pollQueue]
+                        self.pollQueue = []
+                    if not self.pollQueue:
+                        # Nothing left to poll.  startPolling() starts a new poller thread when it is needed again.
+                        self.pollerThread = None
+                        break
+                    waitTime = self.pollQueue[0][0] - time.monotonic()
+                    if waitTime <= 0:
+                        loadJob = heapq.heappop(self.pollQueue)[2]
+                    else:
+                        self.pollCondition.wait(waitTime)
+
+            for stoppedJob in stoppedJobs:
+                errorMsg = "Load job manager was shut down while polling load job %s for model %s.  Its last status was %s and it was not deleted" % (stoppedJob.jobID, stoppedJob.modelID, self.lastJobStatus(stoppedJob))
+                self.stopPolling(stoppedJob, JobTimeoutError(errorMsg))
+            if loadJob is None:
+                return
+            self.pollJob(loadJob)
+
+    def isTransientError(self, error):
+        # No status code means the request itself failed, e.g. a dropped connection
+        statusCode = getattr(error, "statusCode", None)
+        return (statusCode is None) or (statusCode == 429) or (statusCode >= 500)
+
+    def pollJob(self, loadJob):
+        # Reads the job's status once and either finishes the job, or schedules its next poll
+        try:
+            statusResponse = self.sacConnection.getJobStatus(loadJob.jobID)
+        except RESTError as e:
+            if self.isTransientError(e) and (loadJob.pollFailures < self.maxPollRetries):
+                loadJob.pollFailures = loadJob.pollFailures + 1
+                self.scheduleNextPoll(loadJob)
+            else:
+                errorMsg = "Stopped polling load job %s for model %s, as its status could not be read.  It was not deleted.  %s" % (loadJob.jobID, loadJob.modelID, e)
+                self.stopPolling(loadJob, JobTimeoutError(errorMsg))
+            return
+        except Exception as e:
+            self.stopPolling(loadJob, e)
+            return
+
+        loadJob.pollFailures = 0
+        loadJob.statusResponse = statusResponse
+        jobStatus = statusResponse.get("jobStatus")
+        if jobStatus == JobStatus.COMPLETED:
+            self.completeLoadJob(loadJob, statusResponse)
+        elif jobStatus == JobStatus.FAILED:
+            errorMsg = "Load job %s for model %s failed.  %s" % (loadJob.jobID, loadJob.modelID, statusResponse)
+            self.failLoadJob(loadJob, JobFailedError(errorMsg))
+        else:
+            self.scheduleNextPoll(loadJob)
+
+    def scheduleNextPoll(self, loadJob):
+        waitTime = loadJob.pollInterval
+        if loadJob.pollDeadline is not None:
+            remaining = loadJob.pollDeadline - time.monotonic()
+            if remaining <= 0:
+                errorMsg = "Stopped polling load job %s for model %s after %s seconds.  Its last status was %s and it was not deleted" % (loadJob.jobID, loadJob.modelID, self.timeout, self.lastJobStatus(loadJob))
+                self.stopPolling(loadJob, JobTimeoutError(errorMsg))
+                return
+            waitTime = min(waitTime, remaining)
+        loadJob.pollInterval = min(loadJob.pollInterval * self.backoffFactor, self.maxPollInterval)
+        self.schedulePoll(loadJob, waitTime)
 
 
 
 class SACConnection(object):
-    def __init__(self, tenantName, dataCenter):
+    def __init__(self, tenantName, dataCenter, urlTenant = None, urlAccessToken = None):
+        # urlTenant and urlAccessToken override the tenant and token URLs, which are otherwise derived from tenantName
+        #   and dataCenter.  E.g. to point sacapi at a local stand-in server, such as sacapi.mockserver
         self.tenantName = tenantName
         self.dataCenter = dataCenter
         self.connectionNamespace = "sap"
-        self.urlAccessToken = "https://" + tenantName + ".authentication." + dataCenter + ".hana.ondemand.com/oauth/token"
-        self.urlExportNamespaces = "https://" + tenantName + "." + dataCenter + ".sapanalytics.cloud/api/v1/dataexport/administration/Namespaces"
-        self.urlExportProviders = "https://" + tenantName + "." + dataCenter + ".sapanalytics.cloud/api/v1/dataexport/administration/Namespaces(NamespaceID='sac')/Providers"
-        self.urlExportProviderRoot = "https://" + tenantName + "." + dataCenter + ".sapanalytics.cloud/api/v1/dataexport/providers/sac"
-        self.urlImportModels = "https://" + tenantName + "." + dataCenter + ".sapanalytics.cloud/api/v1/dataimport/models"
-        self.urlImportJobs = "https://" + tenantName + "." + dataCenter + ".sapanalytics.cloud/api/v1/dataimport/jobs"
+        if urlTenant is None:
+            urlTenant = "https://" + tenantName + "." + dataCenter + ".sapanalytics.cloud"
+        if urlAccessToken is None:
+            urlAccessToken = "https://" + tenantName + ".authentication." + dataCenter + ".hana.ondemand.com/oauth/token"
+        self.urlAccessToken = urlAccessToken
+        self.urlExportNamespaces = urlTenant + "/api/v1/dataexport/administration/Namespaces"
+        self.urlExportProviders = urlTenant + "/api/v1/dataexport/administration/Namespaces(NamespaceID='sac')/Providers"
+        self.urlExportProviderRoot = urlTenant + "/api/v1/dataexport/providers/sac"
+        self.urlImportModels = urlTenant + "/api/v1/dataimport/models"
+        self.urlImportJobs = urlTenant + "/api/v1/dataimport/jobs"
         self.accessToken = None
         self.httpPostHeader = None
         self.providers = {}
         self.providerLookup = {}
         self.modelMetadata = {}
+        self.factDataCache = None
+        self.factDataCacheAuditCheck = False
+        self.factDataCacheAuditCheckInterval = 0
+        self.factDataCacheAuditMarkerColumn = None
 
         #Filters
         self.paramManualOverride = {}
@@ -178,6 +762,7 @@ class SACConnection(object):
         self.filterStringOperations = StringFilters()
         self.logicGateOperators = FilterLogicGateSymbols()
         self.updatePolicy = UpdatePolicy()
+        self.jobStatus = JobStatus()
 
 
     def getAccessToken(self, clientID, clientSecret):
@@ -397,42 +982,65 @@ class SACConnection(object):
 
 
 
+    def stageLoadJob(self, modelMetadata, tupleList, factOnly = True, forceCommit = False, importMethod = "Update"):
+        # Opens a load job, pushes tupleList to staging and validates it.  Returns the jobID of a job that is ready to run.
+        #   If anything goes wrong after the job was opened, the job is deleted, so that no orphaned jobs are left on the tenant.
+        #First test the mapping.  No point un uploading any data if they'll be rejected on the basis of unmatched columns
+        loadResults = {'status': "STARTED", 'responseMessage': ""}
+
+        unmatched = modelMetadata.validateMapping(tupleList)
+        if (len(unmatched['unmatchedModelColumns']) > 0) or (len(unmatched['unmatchedImportCols']) > 0):
+            errorMsg = "First data tuple has unmatched columns."
+            if len(unmatched['unmatchedModelColumns']) > 0:
+                errorMsg = "%s  The following columns are in the SAC model, but not in the tuple: %s." %(errorMsg, unmatched['unmatchedModelColumns'])
+            if len(unmatched['unmatchedImportCols']) > 0:
+                errorMsg = "%s  The following columns are in the SAC model, but not in the tuple: %s." %(errorMsg, unmatched['unmatchedImportCols'])
+            raise UnmatchedColumnsError(errorMsg)
+
+        jobID = self.openLoadJob(modelMetadata, factOnly, importMethod)
+        try:
+            pushResponse = self.pushToStaging(jobID, tupleList)
+
+            if (len(pushResponse['failedRows']) > 0) and (forceCommit is False):
+                errorMsg = "Upload Failed!  %s rows failed on initial load" %(len(pushResponse['failedRows']))
+                loadResults['status'] = "FAILED_INITIAL_LOAD"
+                loadResults['responseMessage'] = errorMsg
+                loadResults['failedNumberRows'] = pushResponse['failedRows']
+                raise InvalidRowsError(loadResults)
+
+            validationSattus = self.validateLoadJob(jobID)
+            if (validationSattus['failedNumberRows'] > 0 ) and (forceCommit is False):
+                errorMsg = "Upload Failed!  %s rows failed in validation" % (validationSattus['failedNumberRows'])
+                loadResults['status'] = "FAILED_VALIDATION"
+                loadResults['responseMessage'] = errorMsg
+                loadResults['failedNumberRows'] = validationSattus['failedNumberRows']
+                loadResults['failedRows'] = validationSattus['failedRows']
+                raise InvalidRowsError(loadResults)
+        except InvalidRowsError as e:
+            self.deleteJob(jobID)
+            raise e
+        except Exception as e:
+            # Best effort cleanup.  The original error is more useful to the caller than a failed delete.
+            try:
+                self.deleteJob(jobID)
+            except Exception:
+                pass
+            raise e
+        return jobID
+
+
     def upload(self, modelMetadata, tupleList, factOnly = True, forceCommit = False, importMethod = "Update"):
         try:
-            #First test the mapping.  No point un uploading any data if they'll be rejected on the basis of unmatched columns
-            loadResults = {'status': "STARTED", 'responseMessage': ""}
-
-            unmatched = modelMetadata.validateMapping(tupleList)
-            if (len(unmatched['unmatchedModelColumns']) > 0) or (len(unmatched['unmatchedImportCols']) > 0):
-                errorMsg = "First data tuple has unmatched columns."
-                if len(unmatched['unmatchedModelColumns']) > 0:
-                    errorMsg = "%s  The following columns are in the SAC model, but not in the tuple: %s." %(errorMsg, unmatched['unmatchedModelColumns'])
-                if len(unmatched['unmatchedImportCols']) > 0:
-                    errorMsg = "%s  The following columns are in the SAC model, but not in the tuple: %s." %(errorMsg, unmatched['unmatchedImportCols'])
-                raise UnmatchedColumnsError(errorMsg)
-            else:
-                jobID = self.openLoadJob(modelMetadata, factOnly, importMethod)
-                pushResponse = self.pushToStaging(jobID, tupleList)
-
-                if (len(pushResponse['failedRows']) > 0) and (forceCommit is False):
-                    errorMsg = "Upload Failed!  %s rows failed on initial load" %(len(pushResponse['failedRows']))
-                    loadResults['status'] = "FAILED_INITIAL_LOAD"
-                    loadResults['responseMessage'] = errorMsg
-                    loadResults['failedNumberRows'] = pushResponse['failedRows']
-                    self.deleteJob(jobID)
-                    raise InvalidRowsError(loadResults)
-                else:
-                    validationSattus = self.validateLoadJob(jobID)
-                    if (validationSattus['failedNumberRows'] > 0 ) and (forceCommit is False):
-                        errorMsg = "Upload Failed!  %s rows failed in validation" % (validationSattus['failedNumberRows'])
-                        loadResults['status'] = "FAILED_VALIDATION"
-                        loadResults['responseMessage'] = errorMsg
-                        loadResults['failedNumberRows'] = validationSattus['failedNumberRows']
-                        loadResults['failedRows'] = validationSattus['failedRows']
-                        self.deleteJob(jobID)
-                        raise InvalidRowsError(loadResults)
-                    else:
-                        commitResponse = self.runJob(jobID)
+            jobID = self.stageLoadJob(modelMetadata, tupleList, factOnly, forceCommit, importMethod)
+            if self.factDataCache is not None:
+                # runJob() only starts the job.  Until it is seen to finish, this model's results are not cached.
+                self.factDataCache.addPendingJob(modelMetadata.modelID, jobID)
+            try:
+                commitResponse = self.runJob(jobID)
+            except Exception as e:
+                if self.factDataCache is not None:
+                    self.factDataCache.finishPendingJob(modelMetadata.modelID, jobID)
+                raise e
         except UnmatchedColumnsError as e:
             raise e
         except InvalidRowsError as e:
@@ -449,6 +1057,54 @@ class SACConnection(object):
                 raise Exception(errorMsg)
 
 
+    def getJobStatus(self, jobID):
+        # Raises RESTError on any non-2xx response.  statusCode is None if the request itself failed.
+        urlJobStatus = self.urlImportJobs + "/" + jobID + "/status"
+        try:
+            jobStatusResponse = self.oauth.get(urlJobStatus)
+        except Exception as e:
+            errorMsg = "Error during load job status read of job %s.  %s" % (jobID, e)
+            raise RESTError(errorMsg)
+
+        if (jobStatusResponse.status_code < 200) or (jobStatusResponse.status_code > 299):
+            errorMsg = "Error during load job status read of job %s.  Status code %s from server.  %s" % (jobID, jobStatusResponse.status_code, jobStatusResponse.text)
+            raise RESTError(errorMsg, jobStatusResponse.status_code)
+        try:
+            return json.loads(jobStatusResponse.text)
+        except ValueError:
+            errorMsg = "Error during load job status read of job %s.  The response is not valid JSON.  %s" % (jobID, jobStatusResponse.text)
+            raise RESTError(errorMsg, jobStatusResponse.status_code)
+
+
+    def createLoadJobManager(self, maxWorkers = 8, pollInterval = 1.0, maxPollInterval = 30.0, backoffFactor = 2.0, timeout = 3600, maxPollRetries = 3):
+        return LoadJobManager(self, maxWorkers, pollInterval, maxPollInterval, backoffFactor, timeout, maxPollRetries)
+
+
+    def enableFactDataCache(self, maxBytes = 64 * 1024 * 1024, ttl = 900, cacheDir = None, maxDiskBytes = 512 * 1024 * 1024, auditCheck = False,
+                            auditCheckInterval = 30, auditMarkerColumn = None):
+        # Opt in to caching getFactData() results.  If auditCheck is True, getFactData() checks the model's audit trail
+        #   at most once every auditCheckInterval seconds per model, and drops the cached results for that model if it
+        #   has changed.  If auditMarkerColumn is given, only the newest audit record, ordered by that column, is read
+        #   for the check.  Otherwise the check reads the whole AuditData.
+        if (auditCheckInterval is None) or (not isinstance(auditCheckInterval, (int, float))) or isinstance(auditCheckInterval, bool) or (auditCheckInterval < 0):
+            errorMsg = "Invalid value '%s' passed as auditCheckInterval.  It must be a number of seconds, and not negative" % auditCheckInterval
+            raise CacheConfigError(errorMsg)
+        self.factDataCache = FactDataCache(maxBytes, ttl, cacheDir, maxDiskBytes)
+        self.factDataCacheAuditCheck = auditCheck
+        self.factDataCacheAuditCheckInterval = auditCheckInterval
+        self.factDataCacheAuditMarkerColumn = auditMarkerColumn
+        return self.factDataCache
+
+    def disableFactDataCache(self):
+        self.factDataCache = None
+        self.factDataCacheAuditCheck = False
+        self.factDataCacheAuditCheckInterval = 0
+        self.factDataCacheAuditMarkerColumn = None
+
+    def clearFactDataCache(self, providerID = None):
+        if self.factDataCache is not None:
+            self.factDataCache.invalidate(providerID)
+
 
     def searchProviders(self, searchstr):
         #Use this method to look up a provider ID, if you know the name of the model
@@ -570,6 +1226,7 @@ class SACConnection(object):
             modelMetadata = ModelMetadata(providerID)
             urlMetadata = self.urlExportProviderRoot + "/" + providerID + "/$metadata"
             response = self.oauth.get(urlMetadata)
+            modelMetadata.metadataVersion = hashlib.sha256(response.text.encode("UTF-8")).hexdigest()
 
             xmlData = minidom.parseString(response.text.encode("UTF-8"))
             for entityTypeElement in xmlData.getElementsByTagName("EntityType"):
@@ -658,9 +1315,11 @@ class SACConnection(object):
         try:
             providerID = modelMetadata.modelID
             urlAuditData = self.urlExportProviderRoot + "/" + providerID + "/AuditData"
-            response = self.oauth.get(urlAuditData)
-            responseJson = json.loads(response.text)
-            return responseJson["value"]
+            auditRecords = self.auditDataRecordRollup(urlAuditData)
+            if (self.factDataCache is not None) and (self.factDataCacheAuditMarkerColumn is None):
+                # With an audit marker column, the cache fingerprints only the newest audit record; see checkFactDataCacheAudit()
+                self.factDataCache.checkAuditData(providerID, auditRecords)
+            return auditRecords
         except Exception as e:
             errorMsg = "Unknown error during token acquisition."
             if e.status_code:
@@ -677,8 +1336,29 @@ class SACConnection(object):
             providerID = modelMetadata.modelID
             filterString = self.resolveFilter(providerID, pagesize)
             urlFactData = self.urlExportProviderRoot + "/" + providerID + "/FactData" + filterString
-            fdRecordList = self.factDataRecordRollup(urlFactData)
+            if self.factDataCache is None:
+                return self.factDataRecordRollup(urlFactData)
+
+            if self.factDataCache.isPending(providerID):
+                self.refreshPendingJobs(providerID)
+                if self.factDataCache.isPending(providerID):
+                    # A load job into this model is still running, so whatever we read now will soon be stale
+                    return self.factDataRecordRollup(urlFactData)
+
+            cacheKey = self.factDataCache.makeKey(modelMetadata, urlFactData)
+            if cacheKey is None:
+                return self.factDataRecordRollup(urlFactData)
+
+            if self.factDataCacheAuditCheck and self.factDataCache.auditCheckDue(providerID, self.factDataCacheAuditCheckInterval):
+                # Reading the audit trail invalidates this model's cache entries, if the model data has changed
+                self.checkFactDataCacheAudit(modelMetadata)
+            fdRecordList = self.factDataCache.get(cacheKey, providerID)
+            if fdRecordList is None:
+                fdRecordList = self.factDataRecordRollup(urlFactData)
+                self.factDataCache.put(cacheKey, providerID, fdRecordList)
             return fdRecordList
+        except RESTError as re:
+            raise re
         except Exception as e:
             errorMsg = "Unknown error during fact data acquisition."
             if e.status_code:
@@ -688,6 +1368,44 @@ class SACConnection(object):
                 errorMsg = "%s  %s" %(errorMsg, e.error)
                 raise Exception(errorMsg)
 
+    def refreshPendingJobs(self, providerID):
+        # Check the load jobs that were run against this model.  Once a job has finished, its model's cache entries are dropped.
+        #   Only COMPLETED, FAILED, or a 404 for a job that SAC no longer knows about count as finished.  If the status
+        #   can not be read, the job is assumed to still be running.
+        for jobID in self.factDataCache.pendingJobIDs(providerID):
+            try:
+                jobStatus = self.getJobStatus(jobID).get("jobStatus")
+            except RESTError as re:
+                if re.statusCode == 404:
+                    self.factDataCache.finishPendingJob(providerID, jobID)
+                continue
+            if (jobStatus == JobStatus.COMPLETED) or (jobStatus == JobStatus.FAILED):
+                self.factDataCache.finishPendingJob(providerID, jobID)
+
+    def checkFactDataCacheAudit(self, modelMetadata):
+        providerID = modelMetadata.modelID
+        if self.factDataCacheAuditMarkerColumn is None:
+            # getAuditData() passes the whole audit trail to the cache
+            self.getAuditData(modelMetadata)
+            return
+
+        # The audit trail only grows, so its newest record changes whenever the model data does
+        urlAuditMarker = "%s/%s/AuditData?$orderby=%s desc&$top=1" % (self.urlExportProviderRoot, providerID, self.factDataCacheAuditMarkerColumn)
+        response = self.oauth.get(urlAuditMarker)
+        if (response.status_code < 200) or (response.status_code > 299):
+            errorMsg = "Error during audit data read of model %s.  Status code %s from server.  %s" % (providerID, response.status_code, response.text)
+            raise RESTError(errorMsg, response.status_code)
+        self.factDataCache.checkAuditData(providerID, json.loads(response.text)["value"])
+
+    def auditDataRecordRollup(self, urlAuditData):
+        auditRecordList = []
+        while urlAuditData is not None:
+            response = self.oauth.get(urlAuditData)
+            responseJson = json.loads(response.text)
+            auditRecordList.extend(responseJson["value"])
+            urlAuditData = responseJson.get("@odata.nextLink")
+        return auditRecordList
+
     def factDataRecordRollup(self, urlFactData):
         response = self.oauth.get(urlFactData)
         responseJson = json.loads(response.text)
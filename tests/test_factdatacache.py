@@ -0,0 +1,148 @@
+import os
+
+import pytest
+
+from sacapi import sacapi
+
+MODEL_ID = "MOCKMODEL0001"
+
+
+def records(nRecords, value = "x"):
+    return [{"Dimension1": value, "Measure1": nRecord} for nRecord in range(nRecords)]
+
+
+def diskFiles(cacheDir):
+    return sorted(fileName for fileName in os.listdir(cacheDir) if fileName.endswith(".json"))
+
+
+def test_memory_tier_evicts_least_recently_used_by_bytes():
+    entrySize = sacapi.FactDataCache().estimateSize(records(10))
+    cache = sacapi.FactDataCache(maxBytes=2 * entrySize + 1)
+    cache.put("a", MODEL_ID, records(10))
+    cache.put("b", MODEL_ID, records(10))
+    assert cache.get("a", MODEL_ID) is not None
+
+    cache.put("c", MODEL_ID, records(10))
+
+    assert cache.get("b", MODEL_ID) is None
+    assert cache.get("a", MODEL_ID) == records(10)
+    assert cache.get("c", MODEL_ID) == records(10)
+    assert cache.stats()["bytes"] == 2 * entrySize
+
+
+def test_entry_larger_than_memory_tier_is_not_kept():
+    cache = sacapi.FactDataCache(maxBytes=10)
+    cache.put("a", MODEL_ID, records(10))
+
+    assert cache.stats()["entries"] == 0
+    assert cache.get("a", MODEL_ID) is None
+
+
+def test_cached_records_are_copies():
+    cache = sacapi.FactDataCache()
+    cache.put("a", MODEL_ID, records(2))
+    cache.get("a", MODEL_ID)[0]["Measure1"] = 99
+
+    assert cache.get("a", MODEL_ID) == records(2)
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(sacapi.time, "time", lambda: now[0])
+    cache = sacapi.FactDataCache(ttl=60)
+    cache.put("a", MODEL_ID, records(2))
+
+    now[0] = 1059.0
+    assert cache.get("a", MODEL_ID) is not None
+    now[0] = 1061.0
+    assert cache.get("a", MODEL_ID) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_disk_tier_evicts_least_recently_used_files_by_size(tmp_path):
+    cacheDir = str(tmp_path)
+    sizingCache = sacapi.FactDataCache(cacheDir=cacheDir)
+    sizingCache.put("sizing", MODEL_ID, records(10))
+    fileSize = os.path.getsize(sizingCache.diskPathForKey("sizing", MODEL_ID))
+    sizingCache.invalidate()
+
+    cache = sacapi.FactDataCache(cacheDir=cacheDir, maxDiskBytes=2 * fileSize + fileSize // 2)
+    cache.put("a", MODEL_ID, records(10))
+    os.utime(cache.diskPathForKey("a", MODEL_ID), (0, 0))
+    cache.put("b", MODEL_ID, records(10))
+    os.utime(cache.diskPathForKey("b", MODEL_ID), (100, 100))
+    cache.put("c", MODEL_ID, records(10))
+
+    assert not os.path.exists(cache.diskPathForKey("a", MODEL_ID))
+    assert os.path.exists(cache.diskPathForKey("b", MODEL_ID))
+    assert os.path.exists(cache.diskPathForKey("c", MODEL_ID))
+
+
+def test_disk_tier_serves_a_new_cache(tmp_path):
+    sacapi.FactDataCache(cacheDir=str(tmp_path)).put("a", MODEL_ID, records(3))
+
+    cache = sacapi.FactDataCache(cacheDir=str(tmp_path))
+
+    assert cache.get("a", MODEL_ID) == records(3)
+    assert cache.stats()["hits"] == 1
+
+
+def test_corrupt_disk_file_is_a_miss_and_removed(tmp_path):
+    cache = sacapi.FactDataCache(cacheDir=str(tmp_path))
+    diskPath = cache.diskPathForKey("a", MODEL_ID)
+    with open(diskPath, "w", encoding="utf-8") as diskFile:
+        diskFile.write('{"key": "a", "records": [')
+
+    assert cache.get("a", MODEL_ID) is None
+    assert not os.path.exists(diskPath)
+
+
+def test_audit_change_drops_entries_stored_under_old_audit_data(tmp_path):
+    cache = sacapi.FactDataCache(cacheDir=str(tmp_path))
+    assert not cache.checkAuditData(MODEL_ID, [])
+    cache.put("a", MODEL_ID, records(3))
+
+    assert cache.checkAuditData(MODEL_ID, [{"jobID": "job1"}])
+    assert cache.get("a", MODEL_ID) is None
+    assert diskFiles(str(tmp_path)) == []
+
+
+def test_results_are_not_stored_while_a_job_is_pending():
+    cache = sacapi.FactDataCache()
+    cache.addPendingJob(MODEL_ID, "job1")
+    cache.put("a", MODEL_ID, records(3))
+    assert cache.get("a", MODEL_ID) is None
+
+    cache.finishPendingJob(MODEL_ID, "job1")
+    cache.put("a", MODEL_ID, records(3))
+    assert cache.get("a", MODEL_ID) == records(3)
+
+
+def test_no_key_without_metadata_version():
+    cache = sacapi.FactDataCache()
+    modelMetadata = sacapi.ModelMetadata(MODEL_ID)
+    assert cache.makeKey(modelMetadata, "url") is None
+
+    modelMetadata.metadataVersion = "v1"
+    assert cache.makeKey(modelMetadata, "url") == "v1|url"
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"maxBytes": 0},
+    {"maxBytes": -1},
+    {"maxBytes": None},
+    {"maxBytes": "x"},
+    {"maxBytes": True},
+    {"ttl": 0},
+    {"ttl": "60"},
+    {"cacheDir": "unused", "maxDiskBytes": 0},
+    {"cacheDir": "unused", "maxDiskBytes": "x"},
+])
+def test_invalid_configuration_raises_cache_config_error(kwargs):
+    with pytest.raises(sacapi.CacheConfigError):
+        sacapi.FactDataCache(**kwargs)
+
+
+# SPDX-FileCopyrightText: 2023 SAP SE or an SAP affiliate company <david.stocker@sap.com>
+#
+# SPDX-License-Identifier: Apache-2.0
@@ -0,0 +1,309 @@
+import time
+
+import pytest
+
+from sacapi import sacapi
+from sacapi import mockserver
+
+MODEL_ID = "MOCKMODEL0001"
+
+
+@pytest.fixture(autouse=True)
+def insecureTransport(monkeypatch):
+    # The mock server speaks plain http
+    monkeypatch.setenv("OAUTHLIB_INSECURE_TRANSPORT", "1")
+
+
+@pytest.fixture
+def startServer():
+    servers = []
+
+    def start(nModels = 1, rows = 50, jobDuration = 0.0, failingModels = 0, pageSize = 20):
+        models = mockserver.createModels(nModels, nDimensions=2, nMeasures=1, cardinality=5, rows=rows, failingModels=failingModels)
+        server = mockserver.MockSACServer(models, pageSize=pageSize, jobDuration=jobDuration).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def connect(server):
+    sac = sacapi.SACConnection("mock", "local", urlTenant=server.url, urlAccessToken=server.urlAccessToken)
+    sac.connect("clientID", "appSecret")
+    return sac
+
+
+def test_export_reads_every_page(startServer):
+    server = startServer(rows=50, pageSize=20)
+    sac = connect(server)
+    md = sac.getModelMetadata(MODEL_ID)
+    server.resetStats()
+
+    factData = sac.getFactData(md)
+
+    assert len(factData) == 50
+    assert server.stats()["requests"] == {"factData": 3}
+
+
+def test_cached_export_makes_no_factdata_requests(startServer):
+    server = startServer()
+    sac = connect(server)
+    md = sac.getModelMetadata(MODEL_ID)
+    factDataCache = sac.enableFactDataCache()
+    firstRead = sac.getFactData(md)
+    server.resetStats()
+
+    secondRead = sac.getFactData(md)
+
+    assert secondRead == firstRead
+    assert "factData" not in server.stats()["requests"]
+    assert factDataCache.stats()["hits"] == 1
+
+
+def test_audit_change_invalidates_disk_cache_in_new_session(startServer, tmp_path):
+    server = startServer()
+    sessionA = connect(server)
+    md = sessionA.getModelMetadata(MODEL_ID)
+    sessionA.enableFactDataCache(cacheDir=str(tmp_path))
+    factData = sessionA.getFactData(md)
+    with sessionA.createLoadJobManager(pollInterval=0.01) as manager:
+        manager.submit(md, factData[:5]).result()
+
+    sessionB = connect(server)
+    mdB = sessionB.getModelMetadata(MODEL_ID)
+    factDataCache = sessionB.enableFactDataCache(cacheDir=str(tmp_path), auditCheck=True)
+    server.resetStats()
+    sessionB.getFactData(mdB)
+
+    assert factDataCache.stats()["hits"] == 0
+    assert server.stats()["requests"]["factData"] > 0
+
+
+def test_results_not_cached_while_load_job_runs(startServer):
+    server = startServer(jobDuration=3600)
+    sac = connect(server)
+    md = sac.getModelMetadata(MODEL_ID)
+    factDataCache = sac.enableFactDataCache()
+    factData = sac.getFactData(md)
+
+    sac.upload(md, factData[:5])
+    sac.getFactData(md)
+    sac.getFactData(md)
+    assert factDataCache.isPending(MODEL_ID)
+    assert factDataCache.stats()["hits"] == 0
+
+    # The job completes at its next status read
+    server.jobDuration = 0
+    sac.getFactData(md)
+    sac.getFactData(md)
+    assert not factDataCache.isPending(MODEL_ID)
+    assert factDataCache.stats()["hits"] == 1
+
+
+def test_manager_jobs_complete_and_leave_no_jobs(startServer):
+    server = startServer(nModels=3, jobDuration=0.05)
+    sac = connect(server)
+    mds = [sac.getModelMetadata(modelID) for modelID in sorted(server.models)]
+    factData = sac.getFactData(mds[0])
+    finished = []
+
+    with sac.createLoadJobManager(maxWorkers=3, pollInterval=0.01) as manager:
+        loadJobs = [manager.submit(md, factData, callback=finished.append) for md in mds]
+        done, notDone = manager.wait()
+
+    assert len(done) == 3 and notDone == []
+    assert [loadJob.status for loadJob in loadJobs] == [sacapi.JobStatus.COMPLETED] * 3
+    assert all(loadJob.tupleList is None for loadJob in loadJobs)
+    assert len(finished) == 3
+    assert server.jobs == {}
+    assert len(manager.forgetFinishedJobs()) == 3
+    assert manager.jobs == []
+
+
+def test_invalid_rows_job_is_deleted(startServer):
+    server = startServer()
+    sac = connect(server)
+    md = sac.getModelMetadata(MODEL_ID)
+    factData = sac.getFactData(md)[:3]
+    del factData[1]["Measure1"]
+
+    with pytest.raises(sacapi.InvalidRowsError):
+        sac.upload(md, factData)
+    assert server.jobs == {}
+
+
+def test_failed_job_is_deleted(startServer):
+    server = startServer(failingModels=1)
+    sac = connect(server)
+    md = sac.getModelMetadata(MODEL_ID)
+    factData = sac.getFactData(md)
+
+    with sac.createLoadJobManager(pollInterval=0.01) as manager:
+        loadJob = manager.submit(md, factData)
+        with pytest.raises(sacapi.JobFailedError):
+            loadJob.result()
+
+    assert loadJob.status == sacapi.JobStatus.FAILED
+    assert server.jobs == {}
+
+
+def test_running_job_is_kept_when_polling_stops(startServer):
+    server = startServer(jobDuration=30)
+    sac = connect(server)
+    md = sac.getModelMetadata(MODEL_ID)
+    factData = sac.getFactData(md)
+
+    with sac.createLoadJobManager(pollInterval=0.01, maxPollInterval=0.05, timeout=0.2) as manager:
+        loadJob = manager.submit(md, factData)
+        with pytest.raises(sacapi.JobTimeoutError):
+            loadJob.result()
+
+    assert loadJob.status == sacapi.JobStatus.POLLING_STOPPED
+    assert list(server.jobs) == [loadJob.jobID]
+    assert server.jobs[loadJob.jobID]["status"] == "PROCESSING"
+
+
+def waitFor(condition, timeout = 10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met within %s seconds" % timeout
+        time.sleep(0.01)
+
+
+def test_jobs_in_flight_are_not_limited_by_workers(startServer):
+    server = startServer(nModels=6, jobDuration=3600)
+    sac = connect(server)
+    mds = [sac.getModelMetadata(modelID) for modelID in sorted(server.models)]
+    factData = sac.getFactData(mds[0])
+
+    with sac.createLoadJobManager(maxWorkers=2, pollInterval=0.01, maxPollInterval=0.05) as manager:
+        loadJobs = [manager.submit(md, factData) for md in mds]
+        # All six jobs are running on the tenant at once, although there are only two workers
+        waitFor(lambda: (len(server.jobs) == 6) and all(job["status"] == "PROCESSING" for job in list(server.jobs.values())))
+        server.jobDuration = 0
+        manager.wait()
+
+    assert [loadJob.status for loadJob in loadJobs] == [sacapi.JobStatus.COMPLETED] * 6
+
+
+def test_transient_status_errors_are_retried(startServer):
+    server = startServer()
+    sac = connect(server)
+    md = sac.getModelMetadata(MODEL_ID)
+    factData = sac.getFactData(md)
+    server.statusFailures = 2
+
+    with sac.createLoadJobManager(pollInterval=0.01, maxPollRetries=2) as manager:
+        loadJob = manager.submit(md, factData)
+        loadJob.result()
+
+    assert loadJob.status == sacapi.JobStatus.COMPLETED
+
+
+def test_status_read_errors_stop_polling_without_deleting(startServer):
+    server = startServer()
+    sac = connect(server)
+    md = sac.getModelMetadata(MODEL_ID)
+    factData = sac.getFactData(md)
+    server.statusFailures = 2
+
+    with sac.createLoadJobManager(pollInterval=0.01, maxPollRetries=1) as manager:
+        loadJob = manager.submit(md, factData)
+        with pytest.raises(sacapi.JobTimeoutError):
+            loadJob.result()
+
+    assert loadJob.status == sacapi.JobStatus.POLLING_STOPPED
+    assert list(server.jobs) == [loadJob.jobID]
+
+
+def test_job_status_raises_on_error_responses(startServer):
+    server = startServer()
+    sac = connect(server)
+
+    with pytest.raises(sacapi.RESTError) as excInfo:
+        sac.getJobStatus("noSuchJob")
+    assert excInfo.value.statusCode == 404
+
+
+def addAuditRecords(server, nRecords):
+    auditRecords = server.models[MODEL_ID].auditRecords
+    for nRecord in range(nRecords):
+        auditRecords.append({"jobID": "job%s" % len(auditRecords), "rows": 1, "Timestamp": "%.6f" % (1000 + len(auditRecords))})
+
+
+def test_pending_job_stays_pending_on_status_errors(startServer):
+    server = startServer(jobDuration=3600)
+    sac = connect(server)
+    md = sac.getModelMetadata(MODEL_ID)
+    factDataCache = sac.enableFactDataCache()
+    sac.upload(md, sac.getFactData(md)[:5])
+    jobID = list(server.jobs)[0]
+
+    server.statusFailures = 1
+    sac.getFactData(md)
+    assert factDataCache.isPending(MODEL_ID)
+
+    # A job that SAC no longer knows about is finished
+    del server.jobs[jobID]
+    sac.getFactData(md)
+    assert not factDataCache.isPending(MODEL_ID)
+
+
+def test_audit_data_follows_next_link(startServer):
+    server = startServer(pageSize=2)
+    addAuditRecords(server, 5)
+    sac = connect(server)
+    md = sac.getModelMetadata(MODEL_ID)
+    server.resetStats()
+
+    assert len(sac.getAuditData(md)) == 5
+    assert server.stats()["requests"] == {"auditData": 3}
+
+
+def test_audit_marker_reads_only_the_newest_record(startServer):
+    server = startServer(pageSize=2)
+    addAuditRecords(server, 5)
+    sac = connect(server)
+    md = sac.getModelMetadata(MODEL_ID)
+    factDataCache = sac.enableFactDataCache(auditCheck=True, auditCheckInterval=0, auditMarkerColumn="Timestamp")
+    sac.getFactData(md)
+    server.resetStats()
+
+    sac.getFactData(md)
+    assert server.stats()["requests"] == {"auditData": 1}
+    assert factDataCache.stats()["hits"] == 1
+
+    addAuditRecords(server, 1)
+    sac.getFactData(md)
+    assert factDataCache.stats()["hits"] == 1
+
+
+def test_audit_check_is_rate_limited_per_model(startServer):
+    server = startServer()
+    sac = connect(server)
+    md = sac.getModelMetadata(MODEL_ID)
+    sac.enableFactDataCache(auditCheck=True, auditCheckInterval=3600)
+    server.resetStats()
+
+    sac.getFactData(md)
+    sac.getFactData(md)
+    assert server.stats()["requests"] == {"auditData": 1, "factData": 3}
+
+
+def test_model_metadata_without_version_is_not_cached(startServer):
+    server = startServer()
+    sac = connect(server)
+    md = sac.getModelMetadata(MODEL_ID)
+    md.metadataVersion = None
+    factDataCache = sac.enableFactDataCache()
+
+    sac.getFactData(md)
+    sac.getFactData(md)
+    assert factDataCache.stats()["entries"] == 0
+
+
+# SPDX-FileCopyrightText: 2023 SAP SE or an SAP affiliate company <david.stocker@sap.com>
+#
+# SPDX-License-Identifier: Apache-2.0